@@ -1,4 +1,5 @@
 import os
+import numpy as np
 
 def get_next_chunk_number(base_dir, run_name):
     chunk_dirs = [d for d in os.listdir(base_dir) if d.startswith(f"{run_name}_chunk_")]
@@ -22,4 +23,21 @@ def get_next_chunk_number(base_dir, run_name):
             return chunk_num
     
     # All chunks are complete, return the next number
-    return max(chunk_numbers) + 1
\ No newline at end of file
+    return max(chunk_numbers) + 1
+
+
+def split_into_chunks(release_polygons, number_of_release_groups_per_chunk):
+    """
+    Split the release polygons into the chunks that are run one after another.
+    Args:
+        release_polygons (list): List of release polygons in OceanTracker format.
+        number_of_release_groups_per_chunk (int): Max number of release groups per chunk.
+    Returns:
+        list: List of chunks, each a list of release polygons.
+    """
+    if number_of_release_groups_per_chunk < 1:
+        raise ValueError("number_of_release_groups_per_chunk has to be at least 1.")
+
+    n = number_of_release_groups_per_chunk
+    number_of_chunks = int(np.ceil(len(release_polygons) / n))
+    return [release_polygons[ii * n : (ii + 1) * n] for ii in range(number_of_chunks)]
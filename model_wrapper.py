@@ -1,5 +1,17 @@
 from oceantracker.main import OceanTracker
 
+# Particle lifetime and age binning of the polygon stats.
+# Shared with the pre-flight estimator in preflight.py, so change them here only.
+max_age = 6 * 365 * 24 * 3600
+min_age_to_bin = 0 * 365 * 24 * 3600
+age_bin_size = 30 * 24 * 3600
+max_age_to_bin = 6 * 365 * 24 * 3600
+
+# Hindcast time steps held in memory and the velocity variables read from the hindcast files
+time_buffer_size = 3
+nz_velocity_variables = ["vsurf"]
+au_velocity_variables = ["u", "v"]
+
 def run_AU_to_NZ_model(
     number_of_threads,
     hindcast_dir_nz,
@@ -28,7 +40,7 @@ def run_AU_to_NZ_model(
         time_step=timeStep,
         restart_interval=30 * 24 * 3600,
         use_open_boundary=True,
-        time_buffer_size=3,
+        time_buffer_size=time_buffer_size,
         write_tracks=False,
     )
 
@@ -39,7 +51,7 @@ def run_AU_to_NZ_model(
         file_mask=hindcast_mask_nz,
         grid_variable_map=dict(x="longitude", y="latitude"),  # remap x to long lat
         field_variable_map=dict(
-            water_velocity=["vsurf"]
+            water_velocity=nz_velocity_variables
         ),  # remap vel to surf values in file
         hgrid_file_name=hgrid_file_name,
         # to convert the NZTM grid to LON LAT
@@ -53,7 +65,7 @@ def run_AU_to_NZ_model(
         file_mask=hindcast_mask_au,
         grid_variable_map=dict(x="longitude", y="latitude"),  # remap x to long lat
         field_variable_map=dict(
-            water_velocity_depth_averaged=["u", "v"]
+            water_velocity_depth_averaged=au_velocity_variables
         ),  # remap vel to surf values in file
     )
 
@@ -72,7 +84,7 @@ def run_AU_to_NZ_model(
             start=releaseStartDate,
             duration=durationDays * 24 * 3600,
             max_cycles_to_find_release_points=5,
-            max_age=6 * 365 * 24 * 3600,
+            max_age=max_age,
         )
 
     ot.add_class(
@@ -81,9 +93,9 @@ def run_AU_to_NZ_model(
         name="shore_to_shore_poly_monthly",
         update_interval=statsInterval,
         polygon_list=nz_coastal_polygons,
-        min_age_to_bin=0 * 365 * 24 * 3600,
-        age_bin_size=30 * 24 * 3600,
-        max_age_to_bin=6 * 365 * 24 * 3600,
+        min_age_to_bin=min_age_to_bin,
+        age_bin_size=age_bin_size,
+        max_age_to_bin=max_age_to_bin,
     )
 
     ot.add_class("dispersion", A_H=0.1)
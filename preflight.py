@@ -0,0 +1,417 @@
+# Pre-flight checks for the chunked AU to NZ runs.
+# Estimates what each chunk will release, hold in memory, read from the hindcast
+# and how long it will take, and rejects configurations that would not fit the
+# node before anything is launched. Mistakes in the driver constants otherwise
+# only show up hours into a run.
+
+import os
+import glob
+import numpy as np
+from netCDF4 import Dataset
+
+from batching import split_into_chunks
+from model_wrapper import max_age, min_age_to_bin, age_bin_size, max_age_to_bin
+from model_wrapper import time_buffer_size, nz_velocity_variables, au_velocity_variables
+
+# Rough per particle footprint of OceanTracker in 2D (positions, velocities,
+# barycentric coords, cell ids, ages, status, ids, RK2 work arrays, ...) in bytes
+bytes_per_particle = 256
+
+# Bytes of one cell in the age based polygon stats count arrays (int64/float64)
+bytes_per_stats_cell = 8
+
+# Bytes of one buffered hindcast field value (float32) and rough footprint of
+# the grid per node (coords, triangles, adjacency, barycentric transforms, ...)
+bytes_per_field_value = 4
+bytes_per_grid_node = 200
+
+# Share of the memory available on the node a chunk may use, the estimates are rough
+memory_headroom = 0.8
+
+# Anything longer than this is almost certainly a unit mistake, e.g. seconds
+# passed where days are expected
+max_plausible_run_duration = 100 * 365 * 24 * 3600
+
+
+def available_memory_bytes():
+    """
+    Memory available to this process, i.e. the physical memory of the node capped by
+    the cgroup memory limit the scheduler puts on the job (cgroup v2 or v1).
+    Returns:
+        int: Available memory in bytes.
+    """
+    limits = [os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")]
+
+    # the job's own cgroup from /proc/self/cgroup, plus the cgroup root as seen in containers
+    candidates = ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]
+    try:
+        with open("/proc/self/cgroup", "r") as f:
+            for line in f:
+                _, controllers, path = line.strip().split(":", 2)
+                if controllers == "":
+                    candidates.append(f"/sys/fs/cgroup{path}/memory.max")
+                elif "memory" in controllers.split(","):
+                    candidates.append(f"/sys/fs/cgroup/memory{path}/memory.limit_in_bytes")
+    except OSError:
+        pass
+
+    for candidate in candidates:
+        try:
+            with open(candidate, "r") as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v2 reports "max" when unlimited, v1 a huge number
+        if limit.isdigit():
+            limits.append(int(limit))
+
+    return min(limits)
+
+
+def estimate_hindcast_memory(files, velocity_variables):
+    """
+    Estimate the memory a reader holds for its grid and buffered velocity time steps.
+    Args:
+        files (list): Hindcast files of the reader, the first one is used for the grid dimensions.
+        velocity_variables (list): Names of the velocity variables read from the files.
+    Returns:
+        int: Estimated bytes, 0 if there are no files.
+    Raises:
+        ValueError: If the file can't be read or the velocity variables don't look as expected.
+    """
+    if not files:
+        return 0
+
+    try:
+        ds = Dataset(files[0])
+    except OSError as e:
+        raise ValueError(f"can't open hindcast file {files[0]}: {e}")
+
+    with ds:
+        missing = [name for name in velocity_variables if name not in ds.variables]
+        if missing:
+            raise ValueError(f"velocity variables {missing} not in hindcast file {files[0]}")
+
+        values_per_time_step = 0
+        for name in velocity_variables:
+            variable = ds.variables[name]
+            time_dim = variable.dimensions[0] if variable.dimensions else None
+            if (time_dim is None) or not (
+                "time" in time_dim.lower() or ds.dimensions[time_dim].isunlimited()
+            ):
+                raise ValueError(
+                    f"velocity variable {name} in {files[0]} has dimensions {variable.dimensions}, expected time first"
+                )
+            values_per_time_step += int(np.prod(variable.shape[1:]))
+
+        # either one variable holding both components, e.g. vsurf, or one variable per component, e.g. u and v
+        if len(velocity_variables) == 1:
+            n_components = ds.variables[velocity_variables[0]].shape[-1]
+        else:
+            n_components = len(velocity_variables)
+        if n_components != 2:
+            raise ValueError(
+                f"velocity variables {velocity_variables} in {files[0]} have {n_components} components, expected 2"
+            )
+
+    n_nodes = values_per_time_step // n_components
+    return (
+        time_buffer_size * values_per_time_step * bytes_per_field_value
+        + n_nodes * bytes_per_grid_node
+    )
+
+
+def estimate_resources(
+    number_of_threads,
+    hindcast_dir_nz,
+    hindcast_mask_nz,
+    hindcast_dir_au,
+    hindcast_mask_au,
+    durationDays,
+    timeStep,
+    releaseInterval,
+    pulseSize,
+    statsInterval,
+    nz_coastal_polygons,
+    release_polygons,
+    number_of_release_groups_per_chunk,
+    particle_steps_per_second_per_thread,
+    hindcast_read_bytes_per_second,
+):
+    """
+    Estimate the resources needed by every chunk of a run, mirroring run_AU_to_NZ_model.
+    Args:
+        durationDays (float): Run and release duration in days, as passed to run_AU_to_NZ_model.
+        particle_steps_per_second_per_thread (float): Assumed throughput of a single thread in particle time steps per second, scaled by number_of_threads.
+        hindcast_read_bytes_per_second (float): Assumed read rate of the hindcast files.
+        Remaining arguments are the ones of the driver with the same name.
+    Returns:
+        dict: Run wide totals and a list with one estimate per chunk under 'chunks'.
+    """
+    # run_AU_to_NZ_model converts days to seconds for both the run and the releases
+    run_duration = durationDays * 24 * 3600
+
+    # pulses released by a single release group, the first ones live for max_age,
+    # the ones released within max_age of the end of the run are cut short
+    n_pulses = int(run_duration // releaseInterval) + 1
+    if run_duration >= max_age:
+        n_full_pulses = int((run_duration - max_age) // releaseInterval) + 1
+    else:
+        n_full_pulses = 0
+    release_times = np.arange(n_full_pulses, n_pulses) * releaseInterval
+    pulse_steps = n_full_pulses * np.ceil(max_age / timeStep) + np.sum(
+        np.ceil((run_duration - release_times) / timeStep)
+    )
+    particles_per_group = n_pulses * pulseSize
+    # pulses alive at the same time once the first pulses start to reach max_age
+    peak_live_per_group = min(n_pulses, int(max_age // releaseInterval) + 1) * pulseSize
+    particle_steps_per_group = pulse_steps * pulseSize
+
+    n_age_bins = int(np.ceil((max_age_to_bin - min_age_to_bin) / age_bin_size))
+    n_catch_polygons = len(nz_coastal_polygons)
+
+    hindcast_files = {}
+    hindcast_problems = []
+    hindcast_bytes = 0
+    hindcast_memory_bytes = 0
+    for name, input_dir, file_mask, velocity_variables in [
+        ("NZ", hindcast_dir_nz, hindcast_mask_nz, nz_velocity_variables),
+        ("AU", hindcast_dir_au, hindcast_mask_au, au_velocity_variables),
+    ]:
+        # the OceanTracker readers search input_dir recursively
+        files = sorted(glob.glob(os.path.join(input_dir, "**", file_mask), recursive=True))
+        hindcast_files[name] = files
+        hindcast_bytes += sum(os.path.getsize(f) for f in files)
+        try:
+            hindcast_memory_bytes += estimate_hindcast_memory(files, velocity_variables)
+        except ValueError as e:
+            hindcast_problems.append(f"{name} hindcast: {e}")
+
+    chunks = []
+    for polygons_to_process in split_into_chunks(
+        release_polygons, number_of_release_groups_per_chunk
+    ):
+        n_groups = len(polygons_to_process)
+        peak_live = n_groups * peak_live_per_group
+        # counts per age bin, release group and catch polygon plus the
+        # per age bin and release group totals used for normalisation
+        stats_shape = (n_age_bins, n_groups, n_catch_polygons)
+        stats_bytes = (
+            int(np.prod(stats_shape)) + n_age_bins * n_groups
+        ) * bytes_per_stats_cell
+        particle_steps = n_groups * particle_steps_per_group
+
+        chunks.append(
+            {
+                "number_of_release_groups": n_groups,
+                "particles_released": n_groups * particles_per_group,
+                "peak_live_particles": peak_live,
+                "particle_bytes": peak_live * bytes_per_particle,
+                "stats_shape": stats_shape,
+                "stats_bytes": stats_bytes,
+                "hindcast_memory_bytes": hindcast_memory_bytes,
+                "memory_bytes": peak_live * bytes_per_particle
+                + stats_bytes
+                + hindcast_memory_bytes,
+                # every chunk reads the hindcast for the whole run
+                "hindcast_bytes": hindcast_bytes,
+                "particle_steps": particle_steps,
+                "wall_time_seconds": particle_steps
+                / (particle_steps_per_second_per_thread * number_of_threads)
+                + hindcast_bytes / hindcast_read_bytes_per_second,
+            }
+        )
+
+    return {
+        "number_of_threads": number_of_threads,
+        "run_duration": run_duration,
+        "timeStep": timeStep,
+        "releaseInterval": releaseInterval,
+        "statsInterval": statsInterval,
+        "number_of_release_groups": len(release_polygons),
+        "number_of_age_bins": n_age_bins,
+        "hindcast_files": hindcast_files,
+        "hindcast_problems": hindcast_problems,
+        "particles_released": sum(c["particles_released"] for c in chunks),
+        "wall_time_seconds": sum(c["wall_time_seconds"] for c in chunks),
+        "chunks": chunks,
+    }
+
+
+def validate_config(
+    number_of_threads,
+    hgrid_file_name,
+    durationDays,
+    timeStep,
+    releaseInterval,
+    statsInterval,
+    nz_coastal_polygons,
+    release_polygons,
+    number_of_release_groups_per_chunk,
+    **kwargs,
+):
+    """
+    Check the run configuration for mistakes, before anything is estimated.
+    Args:
+        hgrid_file_name (str): SCHISM grid file needed by the NZ reader.
+        Remaining arguments are the same as for estimate_resources, the ones not checked here are ignored.
+    Returns:
+        list: Descriptions of the problems found, empty if the configuration is fine.
+    """
+    problems = []
+
+    run_duration = durationDays * 24 * 3600
+    if run_duration <= 0:
+        problems.append(f"run duration is {run_duration} s, it has to be positive")
+    elif run_duration > max_plausible_run_duration:
+        problems.append(
+            f"run duration is {run_duration / (365 * 24 * 3600):.0f} years, "
+            f"durationDays has to be given in days not seconds"
+        )
+
+    if timeStep <= 0:
+        problems.append(f"timeStep is {timeStep} s, it has to be positive")
+    else:
+        for name, interval in [("releaseInterval", releaseInterval), ("statsInterval", statsInterval)]:
+            if interval <= 0 or interval % timeStep != 0:
+                problems.append(f"{name} ({interval} s) has to be a positive multiple of timeStep ({timeStep} s)")
+    if min_age_to_bin >= max_age_to_bin:
+        problems.append("min_age_to_bin has to be smaller than max_age_to_bin")
+
+    if not os.path.isfile(hgrid_file_name):
+        problems.append(f"hgrid file {hgrid_file_name} not found")
+
+    if number_of_threads < 1:
+        problems.append("number_of_threads has to be at least 1")
+    if number_of_release_groups_per_chunk < 1:
+        problems.append("number_of_release_groups_per_chunk has to be at least 1")
+
+    if not release_polygons:
+        problems.append("no release polygons")
+    for polygons in [release_polygons, nz_coastal_polygons]:
+        names = [poly["name"] for poly in polygons]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            problems.append(f"duplicate polygon names {duplicates}")
+        for poly in polygons:
+            if len(poly["points"]) < 4:
+                problems.append(f"polygon {poly['name']} has less than 4 points")
+
+    return problems
+
+
+def check_budget(estimate, memory_budget_bytes=None, thread_budget=None, wall_time_budget_hours=None, check_this_node=True):
+    """
+    Check the resource estimate against the node budget.
+    Args:
+        estimate (dict): Output of estimate_resources.
+        memory_budget_bytes (int or None): Memory available to a chunk. If None, memory_headroom of the memory available on this node is used, see available_memory_bytes.
+        thread_budget (int or None): Cpus available to a chunk. If None, the cpus this process may run on are used.
+        wall_time_budget_hours (float or None): Max wall time of a single chunk. If None, it is not checked.
+        check_this_node (bool): Whether to fall back to this node's memory and cpus when no budget is given.
+            Set to False when checking on a login node, then budgets left at None are not checked.
+    Returns:
+        tuple: Descriptions of the problems found, empty if the run fits, and names of the budgets that were not checked.
+    """
+    problems = []
+    unchecked = []
+
+    for name, files in estimate["hindcast_files"].items():
+        if not files:
+            problems.append(f"no {name} hindcast files found")
+    problems.extend(estimate["hindcast_problems"])
+
+    if (thread_budget is None) and check_this_node:
+        # respects cgroup / affinity limits, unlike os.cpu_count()
+        thread_budget = len(os.sched_getaffinity(0))
+    if thread_budget is None:
+        unchecked.append("threads")
+    elif estimate["number_of_threads"] > thread_budget:
+        problems.append(
+            f"{estimate['number_of_threads']} threads requested but only {thread_budget} cpus are available"
+        )
+
+    if (memory_budget_bytes is None) and check_this_node:
+        memory_budget_bytes = memory_headroom * available_memory_bytes()
+    if memory_budget_bytes is None:
+        unchecked.append("memory")
+    for ii_chunk, chunk in enumerate(estimate["chunks"]):
+        if (memory_budget_bytes is not None) and (chunk["memory_bytes"] > memory_budget_bytes):
+            problems.append(
+                f"chunk {ii_chunk:03d} needs {chunk['memory_bytes'] / 1e9:.1f} GB, "
+                f"budget is {memory_budget_bytes / 1e9:.1f} GB"
+            )
+        if (wall_time_budget_hours is not None) and (chunk["wall_time_seconds"] > wall_time_budget_hours * 3600):
+            problems.append(
+                f"chunk {ii_chunk:03d} takes {chunk['wall_time_seconds'] / 3600:.1f} h, "
+                f"budget is {wall_time_budget_hours:.1f} h"
+            )
+
+    return problems, unchecked
+
+
+def print_estimate(estimate):
+    """
+    Print the resource estimate in the style of the driver output.
+    Args:
+        estimate (dict): Output of estimate_resources.
+    """
+    print(f"* run duration {estimate['run_duration'] / (365 * 24 * 3600):.1f} years")
+    print(f"* {estimate['number_of_release_groups']} release groups in {len(estimate['chunks'])} chunks")
+    print(f"* total particles released {estimate['particles_released']:,}")
+    print(f"* {estimate['number_of_age_bins']} age bins in the polygon stats")
+    for name, files in estimate["hindcast_files"].items():
+        print(f"* {len(files)} {name} hindcast files")
+    for ii_chunk, chunk in enumerate(estimate["chunks"]):
+        print(
+            f"* chunk {ii_chunk:03d}: "
+            f"{chunk['number_of_release_groups']} release groups, "
+            f"{chunk['particles_released']:,} released, "
+            f"{chunk['peak_live_particles']:,} peak live, "
+            f"memory {chunk['memory_bytes'] / 1e9:.2f} GB "
+            f"(particles {chunk['particle_bytes'] / 1e9:.2f} GB, "
+            f"stats {chunk['stats_shape']} {chunk['stats_bytes'] / 1e6:.1f} MB, "
+            f"hindcast grids and buffers {chunk['hindcast_memory_bytes'] / 1e9:.2f} GB), "
+            f"hindcast read {chunk['hindcast_bytes'] / 1e9:.1f} GB, "
+            f"wall time {chunk['wall_time_seconds'] / 3600:.1f} h"
+        )
+    print(f"* projected total wall time {estimate['wall_time_seconds'] / 3600:.1f} h")
+
+
+def run_preflight(hgrid_file_name, memory_budget_bytes=None, thread_budget=None, wall_time_budget_hours=None, check_this_node=True, **run_config):
+    """
+    Estimate the resources of a run, print them and reject configurations that do not fit.
+    Args:
+        hgrid_file_name (str): See validate_config.
+        memory_budget_bytes (int or None): See check_budget.
+        thread_budget (int or None): See check_budget.
+        wall_time_budget_hours (float or None): See check_budget.
+        check_this_node (bool): See check_budget.
+        run_config: Keyword arguments of estimate_resources.
+    Returns:
+        dict: Output of estimate_resources.
+    Raises:
+        ValueError: If the configuration has any problems.
+    """
+    unchecked = []
+    problems = validate_config(hgrid_file_name=hgrid_file_name, **run_config)
+    if not problems:
+        estimate = estimate_resources(**run_config)
+        print_estimate(estimate)
+        problems, unchecked = check_budget(
+            estimate,
+            memory_budget_bytes=memory_budget_bytes,
+            thread_budget=thread_budget,
+            wall_time_budget_hours=wall_time_budget_hours,
+            check_this_node=check_this_node,
+        )
+    if problems:
+        for problem in problems:
+            print(f"* problem: {problem}")
+        raise ValueError(f"Run configuration rejected, {len(problems)} problem(s) found.")
+    if unchecked:
+        print(f"* {'/'.join(unchecked)} not checked, set the budget in the driver")
+    else:
+        print("* configuration ok")
+
+    return estimate
@@ -1,17 +1,22 @@
 import os
+import sys
 import shutil
-import numpy as np
 
 from load_polygons import prepare_polygons
 from model_wrapper import run_AU_to_NZ_model
 
-from batching import get_next_chunk_number
+from batching import get_next_chunk_number, split_into_chunks
+from preflight import run_preflight
 
 
 # ===========================================================================
 base_run_name = "2025_12_10_v01_AUtoNZ_tmp"
 # ===========================================================================
 
+# Only estimate resources and check the configuration, run with
+# `python ./run_ot_for_sea_spurge_AUtoNZ.py --dry-run`
+dry_run = "--dry-run" in sys.argv
+
 # paralellization
 number_of_threads = 30
 
@@ -24,6 +29,25 @@ i.e. below ~10% and total runtimes at about 1 day
 """
 number_of_release_groups_per_chunk = 10
 
+# Budget of the compute node the chunks run on, runs that don't fit are rejected
+# before anything is launched. Adjust them to the node you submit to.
+memory_budget_bytes = 128e9  # None uses part of the memory available on the node
+thread_budget = 32  # None uses the cpus available to the process on the node
+wall_time_budget_hours = 48  # per chunk
+# Dry runs usually happen on a login node, so only fall back to this node's memory
+# and cpus for real runs. Budgets left at None are not checked in a dry run.
+check_this_node = not dry_run
+
+# Assumed throughput used to project wall times
+"""
+These are assumptions, not measurements. The particle throughput is taken from the
+rough "about a day for 10 release groups on 30 threads" above, spread over the
+30 threads, and the hindcast read rate is a guess. Replace them with timings
+from completed chunks once available.
+"""
+particle_steps_per_second_per_thread = 2e6 / 30
+hindcast_read_bytes_per_second = 200e6
+
 # I/O configuration
 # Model output
 root_output_dir = "/data3/ls/oceantracker_output/sea_spurge_big_boy_runs"
@@ -46,7 +70,7 @@ The current configuration is the bare minimum based on the sensitivity analysis
 that I did.
 """
 # Model configuration
-durationDays = 14 * 365 * 24 * 3600
+durationDays = 14 * 365
 timeStep = 3 * 60 * 60
 
 # Release settings
@@ -70,12 +94,38 @@ release_polygons = au_coastal_polygons
 print(f"* resulting in {len(release_polygons)} release polygons")
 
 
+print("------------------------------ pre-flight check start ---------------------------")
+run_preflight(
+    memory_budget_bytes=memory_budget_bytes,
+    thread_budget=thread_budget,
+    wall_time_budget_hours=wall_time_budget_hours,
+    check_this_node=check_this_node,
+    number_of_threads=number_of_threads,
+    hindcast_dir_nz=hindcast_dir_nz,
+    hindcast_mask_nz=hindcast_mask_nz,
+    hindcast_dir_au=hindcast_dir_au,
+    hindcast_mask_au=hindcast_mask_au,
+    hgrid_file_name=hgrid_file_name,
+    durationDays=durationDays,
+    timeStep=timeStep,
+    releaseInterval=releaseInterval,
+    pulseSize=pulseSize,
+    statsInterval=statsInterval,
+    nz_coastal_polygons=nz_coastal_polygons,
+    release_polygons=release_polygons,
+    number_of_release_groups_per_chunk=number_of_release_groups_per_chunk,
+    particle_steps_per_second_per_thread=particle_steps_per_second_per_thread,
+    hindcast_read_bytes_per_second=hindcast_read_bytes_per_second,
+)
+if dry_run:
+    print("* dry run, nothing launched")
+    sys.exit(0)
+
+
 print("------------------------------ batching setup start ---------------------------")
-number_of_chunks = np.ceil(
-    len(release_polygons) / number_of_release_groups_per_chunk
-).astype(int)
+chunks = split_into_chunks(release_polygons, number_of_release_groups_per_chunk)
 print(f"* max number of releas groups per chunk {number_of_release_groups_per_chunk}")
-print(f"* number of  chunks {number_of_chunks}")
+print(f"* number of  chunks {len(chunks)}")
 
 chunk_output_dir = os.path.join(root_output_dir, base_run_name)
 if os.path.isdir(chunk_output_dir):
@@ -84,18 +134,10 @@ if os.path.isdir(chunk_output_dir):
     shutil.rmtree(chunk_output_dir)
 os.makedirs(chunk_output_dir)
 
-for ii_chunk in range(number_of_chunks):
+for ii_chunk, polygons_to_process in enumerate(chunks):
     # setting up output dir for chunk
     run_name = f"{base_run_name}_chunk_{ii_chunk:03d}"
 
-    # setting up the release groups for current chunk
-    n = number_of_release_groups_per_chunk
-    # Determine which polygons to process in this chunk
-    if len(release_polygons) > 1:
-        polygons_to_process = release_polygons[ii_chunk * n : (ii_chunk + 1) * n]
-    else:
-        polygons_to_process = release_polygons
-
     # Print info about current chunk
     print(f"* processing {len(polygons_to_process)} release groups in this chunk")
 